@@ -1,118 +1,19 @@
 #!/usr/bin/env python
-import airplane
 import vector
-import math
 import flight_control
-import tkinter
-import numpy.random as random
 import sys
-import itertools
-
-RADAR_RADIUS = 70000.0 # range of radar
+from simcore import (RADAR_RADIUS, check_proximity, executeTimestep,
+                     createAirplaneList, generateCollidingPair,
+                     generateRandomPlane, createNameList, scoreGame,
+                     runSimulation)
 
 def main():
     gui = GuiClass()
     gui.go()
 
-def check_proximity(airplane_list):
-    warning_list = []
-    crash_list = []
-    remaining_list = list(airplane_list)
-
-    for o1, o2 in itertools.combinations(remaining_list, 2):
-        dist = o2.getPosition()-o1.getPosition()
-        if abs(dist)<100.0:
-            if o1 not in crash_list:
-                crash_list.append(o1)
-            if o2 not in crash_list:
-                crash_list.append(o2)
-        elif abs(dist.z)<600.0 and (dist.x**2+dist.y**2)<10000.0**2:
-            if o1 not in warning_list:
-                warning_list.append(o1)
-            if o2 not in warning_list:
-                warning_list.append(o2)
-
-    return crash_list, warning_list
-
-def executeTimestep(airplane_list,deltat):
-    for o in airplane_list:
-        o.executeTimestep(deltat)
-
-def createAirplaneList():
-    names = createNameList()
-    p1, p2 = generateCollidingPair(0.0,10000.0,8000.0,names.pop(),names.pop(),200.0)
-    p3, p4 = generateCollidingPair(0.0,0.0,8000.0,names.pop(),names.pop(),250.0)
-    p5, p6 = generateCollidingPair(10000,0.0,7000.0,names.pop(),names.pop(),300.0)
-    p7 = generateRandomPlane(names.pop(),8000.0)
-    p8 = generateRandomPlane(names.pop(),7000.0)
-    p9 = generateRandomPlane(names.pop(),6000.0)
-    p10 = generateRandomPlane(names.pop(),8000.0)
-
-    return [p1,p2,p3,p4,p5,p6,p7,p8,p9,p10]
-    
-def generateCollidingPair(x,y,z,name1,name2,tcollision):
-    """Create a set of airplanes which will collide at position x, y, z in tcollision seconds"""
-    crashpos = vector.recvec(x,y,z)
-
-    phi1 = -math.pi+random.random_sample()*2.0*math.pi
-    phi2 = -math.pi+random.random_sample()*2.0*math.pi
-    v = airplane.ControllableAirplane.vcruise
-
-    v1 = vector.sphvec(v,math.pi/2.0,phi1)
-    v2 = vector.sphvec(v,math.pi/2.0,phi2)
-    pos1 = crashpos-v1*tcollision
-    pos2 = crashpos-v2*tcollision
-
-    airplane1 = airplane.ControllableAirplane(name1,pos1,v1)
-    airplane2 = airplane.ControllableAirplane(name2,pos2,v2)
-
-    return airplane1, airplane2
-
-def generateRandomPlane(name,altitude):
-    phi = -math.pi+random.random_sample()*2.0*math.pi
-    dir_flight = phi+3.0*math.pi/4.0+random.random_sample()*math.pi/2.0
-
-    position = vector.cylvec(70000.0,phi,altitude)
-    velocity = vector.sphvec(airplane.ControllableAirplane.vcruise,math.pi/2.0,dir_flight)
-
-    return airplane.ControllableAirplane(name,position,velocity)
-
-def createNameList():
-    callsigns = ['United','American','Delta','N']
-    names=[]
-    for i in range(10000):
-        names.append(callsigns[i%len(callsigns)]+str(i))
-
-    random.shuffle(names)
-    return names
-
-def scoreGame(airplane_list,penalties):
-    score = 0
-    print(penalties,"points to deduct for penalties.")
-    for a in airplane_list:
-        score+=1000 # Airplane is still there
-        print(a.getName(), end=' ')
-        v = a.getVelocity()
-        p = a.getPosition()
-        heading = math.pi/2.0-v.phi
-        if abs(heading-a.getDesiredHeading())<0.01 or abs(abs(heading-a.getDesiredHeading())-2.0*math.pi)<0.01:
-            score+=500 # Airplane on heading
-            print("on heading", end=' ')
-
-        if abs(p.z-a.getDesiredAltitude())<100.0:
-            score+=250 # Airplane at altitude
-            print("at altitude", end=' ')
-        
-        if abs(abs(v)-a.getDesiredSpeed())<1.0:
-            score+=250 # Airplane at speed
-            print("at speed", end=' ')
-
-        print()
-
-    print("Your score:",score-penalties)
-
 class GuiClass(object):
     def __init__(self):
+        import tkinter # only needed once a window is opened
         self.root = tkinter.Tk()
         self.periodicCount = 0
         self.penalties = 0
@@ -168,6 +69,7 @@ class GuiClass(object):
         
 
     def drawCanvas(self,event=None):
+        import tkinter
         self.canvas.delete(tkinter.ALL)
         width = self.canvas.winfo_width()
         height = self.canvas.winfo_height()
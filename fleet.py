@@ -0,0 +1,361 @@
+"""Compact fleet storage for large stress runs. Instead of one
+airplane.ControllableAirplane object per aircraft (with its own instance
+dictionary and two vector.Threevec objects), a Fleet keeps the state of
+every aircraft in one contiguous array of float64 or float32 values, twelve
+per aircraft, plus a one byte flag marking whether it is still flying. That
+is 97 bytes per aircraft in float64 and 49 in float32 (plus the names, if
+given), so fleets of a million aircraft fit in well under 100 MB.
+Fleet.executeTimestep follows the physics of
+ControllableAirplane.executeTimestep, and Fleet.check_proximity gives the
+same crashes and near-collisions as simcore.check_proximity using a 10 km
+grid rather than comparing every pair.
+
+Float32 precision
+-----------------
+A float32 has a 24 bit significand, so positions are stored to about 8 mm
+at RADAR_RADIUS (70 km) and the spacing doubles with every doubling of
+distance. Each 0.1 second timestep rounds the position, and an aircraft
+flying straight makes much the same rounding every step, so its error grows
+close to linearly with time and with distance from the origin. There is
+also a few meters of error over a run from computing headings and
+velocities in float32, wherever the aircraft is.
+
+Measured with checkPrecision() over 6000 ticks, 10000 random aircraft
+starting within 50 km and flying holdingPattern() stay within 68 km, inside
+FLOAT32_RADIUS, and end within 4.3 m of the float64 run. Flying straight
+from the origin out to 138 km gives 12 m, starting 140 km out gives 47 m,
+and starting 1000 km out gives 225 m, more than the 100 m crash distance.
+FLOAT32_RADIUS is set to RADAR_RADIUS because within it the error stays at
+a few meters: small next to the 10 km and 600 m warning distances, but not
+good enough to decide crashes at the 100 m crash distance exactly. Use
+checkPrecision() to measure the error of a float32 run against the float64
+reference for a given fleet.
+
+The module-level executeTimestep() and check_proximity() run a list of
+ControllableAirplane objects through a float64 Fleet, so this module can be
+given to golden.py as an engine: "python golden.py check golden fleet"."""
+import airplane
+import simcore
+import vector
+import math
+import sys
+import numpy
+
+FIELDS = ('x','y','z','vx','vy','vz',
+          'command_heading','command_speed','command_altitude',
+          'desired_heading','desired_speed','desired_altitude')
+FLOAT32_RADIUS = simcore.RADAR_RADIUS # meters
+CELL_SIZE = 10000.0 # grid spacing for the proximity check, meters
+CRASH_DISTANCE = 100.0 # meters
+WARNING_DISTANCE = 10000.0 # meters
+WARNING_ALTITUDE = 600.0 # meters
+
+class Fleet(object):
+    """The state of n aircraft stored in typed arrays. dtype is numpy.float64
+    or numpy.float32. Each name in FIELDS is an attribute giving a view of
+    that row of the state array, and alive marks aircraft still flying. If
+    names is None the aircraft are named from their index."""
+    def __init__(self,n,dtype=numpy.float64,names=None):
+        self.dtype = numpy.dtype(dtype)
+        if self.dtype not in (numpy.dtype(numpy.float64),numpy.dtype(numpy.float32)):
+            raise ValueError("A Fleet is stored as float64 or float32, not %s"%self.dtype)
+        if names is not None and len(names)!=n:
+            raise ValueError("A Fleet of %d aircraft needs %d names"%(n,n))
+        self.n = n
+        self.names = names
+        self.state = numpy.zeros((len(FIELDS),n),dtype=self.dtype)
+        self.alive = numpy.ones(n,dtype=numpy.bool_)
+        for i, field in enumerate(FIELDS):
+            setattr(self,field,self.state[i])
+
+    def __len__(self):
+        return self.n
+
+    @classmethod
+    def fromAirplanes(cls,airplane_list,dtype=numpy.float64):
+        """Pack a list of ControllableAirplane objects into a Fleet."""
+        fleet = cls(len(airplane_list),dtype,[a.getName() for a in airplane_list])
+        for i, a in enumerate(airplane_list):
+            p = a.getPosition()
+            v = a.getVelocity()
+            fleet.state[:,i] = (p.x,p.y,p.z,v.x,v.y,v.z,
+                                a.commandHeading,a.commandSpeed,a.commandAltitude,
+                                a.desiredHeading,a.desiredSpeed,a.desiredAltitude)
+        return fleet
+
+    @classmethod
+    def random(cls,n,dtype=numpy.float64,radius=None,seed=None):
+        """Create a fleet of n aircraft spread uniformly over a disk of the
+        given radius, at random altitudes and headings and cruise speed. If
+        radius is None it grows with n so the fleet is as dense as the
+        standard 10 airplane scenario within RADAR_RADIUS. Large fleets
+        then reach well past FLOAT32_RADIUS, so their float32 positions are
+        only good for stress-testing speed and memory."""
+        if radius is None:
+            radius = simcore.RADAR_RADIUS*math.sqrt(max(n,10)/10.0)
+        rng = numpy.random.default_rng(seed)
+        fleet = cls(n,dtype)
+        rho = radius*numpy.sqrt(rng.random(n))
+        phi = rng.random(n)*2.0*math.pi
+        heading = rng.random(n)*2.0*math.pi
+        speed = airplane.ControllableAirplane.vcruise
+        fleet.x[:] = rho*numpy.cos(phi)
+        fleet.y[:] = rho*numpy.sin(phi)
+        fleet.z[:] = rng.uniform(airplane.ControllableAirplane.alt_min,airplane.ControllableAirplane.alt_max,n)
+        fleet.vx[:] = speed*numpy.sin(heading)
+        fleet.vy[:] = speed*numpy.cos(heading)
+        fleet.command_heading[:] = heading
+        fleet.command_speed[:] = speed
+        fleet.command_altitude[:] = fleet.z
+        fleet.desired_heading[:] = heading
+        fleet.desired_speed[:] = airplane.ControllableAirplane.vcruise
+        fleet.desired_altitude[:] = airplane.ControllableAirplane.alt_cruise
+        return fleet
+
+    def astype(self,dtype):
+        """Return a copy of the fleet stored with another precision."""
+        fleet = Fleet(self.n,dtype,self.names)
+        fleet.state[:] = self.state
+        fleet.alive[:] = self.alive
+        return fleet
+
+    def getName(self,i):
+        if self.names is None:
+            return "F%d"%i
+        return self.names[i]
+
+    def airplane(self,i):
+        """Return a view of aircraft i with the ControllableAirplane
+        methods, so it can be passed to a flight controller."""
+        return AirplaneView(self,i)
+
+    def airplanes(self):
+        """Return views of all aircraft still flying."""
+        return [AirplaneView(self,i) for i in numpy.flatnonzero(self.alive)]
+
+    def toAirplanes(self):
+        """Unpack the aircraft still flying into ControllableAirplane
+        objects."""
+        result = []
+        for i in numpy.flatnonzero(self.alive):
+            s = [float(v) for v in self.state[:,i]]
+            a = airplane.ControllableAirplane(self.getName(i),vector.recvec(*s[0:3]),vector.recvec(*s[3:6]))
+            a.commandHeading, a.commandSpeed, a.commandAltitude = s[6:9]
+            a.desiredHeading, a.desiredSpeed, a.desiredAltitude = s[9:12]
+            result.append(a)
+        return result
+
+    def memoryUsage(self):
+        """Return the bytes used by each part of the fleet storage."""
+        usage = {'state':self.state.nbytes,'alive':self.alive.nbytes,'names':0}
+        if self.names is not None:
+            usage['names'] = sys.getsizeof(self.names)+sum(sys.getsizeof(name) for name in self.names)
+        return usage
+
+    @property
+    def bytesPerAircraft(self):
+        """The storage used per aircraft, in bytes."""
+        if self.n==0:
+            return 0.0
+        return sum(self.memoryUsage().values())/self.n
+
+    def executeTimestep(self,deltat):
+        """Advance every aircraft still flying by deltat seconds, following
+        ControllableAirplane.executeTimestep."""
+        cls = airplane.ControllableAirplane
+        pi = math.pi
+        speed = numpy.clip(self.command_speed,cls.vmin,cls.vmax)
+        max_delta_altitude = speed*math.sin(cls.max_tilt)*deltat
+        altitude = numpy.clip(self.command_altitude,cls.alt_min,cls.alt_max)
+
+        current_heading = pi/2.0-numpy.arctan2(self.vy,self.vx)
+        current_heading = numpy.where(current_heading<0.0,current_heading+2.0*pi,current_heading)
+
+        delta_altitude = altitude-self.z
+        climb = numpy.arcsin(numpy.clip(delta_altitude/speed/deltat,-1.0,1.0))
+        tilt_set = numpy.where(delta_altitude>max_delta_altitude,cls.max_tilt,
+                   numpy.where((delta_altitude<max_delta_altitude)&(delta_altitude>-max_delta_altitude),
+                               climb,-cls.max_tilt))
+
+        delta_heading = self.command_heading-current_heading
+        delta_heading = numpy.where(delta_heading>pi,delta_heading-2.0*pi,
+                        numpy.where(delta_heading<-pi,delta_heading+2.0*pi,delta_heading))
+        max_delta_heading = cls.turn_rate*deltat
+        heading_set = current_heading+numpy.where(delta_heading>max_delta_heading,max_delta_heading,
+                        numpy.where((delta_heading<max_delta_heading)&(delta_heading>-max_delta_heading),
+                                    delta_heading,-max_delta_heading))
+
+        theta = pi/2.0-tilt_set
+        phi = pi/2.0-heading_set
+        new_vx = speed*numpy.sin(theta)*numpy.cos(phi)
+        new_vy = speed*numpy.sin(theta)*numpy.sin(phi)
+        new_vz = speed*numpy.cos(theta)
+
+        alive = self.alive
+        for p, v, new_v in ((self.x,self.vx,new_vx),(self.y,self.vy,new_vy),(self.z,self.vz,new_vz)):
+            p[alive] += ((v/2.0+new_v/2.0)*deltat)[alive]
+            v[alive] = new_v[alive]
+
+    def check_proximity(self):
+        """Return the indices of aircraft which have crashed and of those
+        too close to another, as simcore.check_proximity does for a list of
+        airplanes. Only aircraft in neighbouring cells of a 10 km grid are
+        compared, so the cost grows with the number of nearby pairs rather
+        than the square of the fleet size."""
+        index = numpy.flatnonzero(self.alive)
+        x = self.x[index]
+        y = self.y[index]
+        ix = numpy.floor(x/CELL_SIZE).astype(numpy.int64)
+        iy = numpy.floor(y/CELL_SIZE).astype(numpy.int64)
+        if len(index)>0:
+            ix -= ix.min()-1
+            iy -= iy.min()-1
+            width = iy.max()+2
+        else:
+            width = 1
+        keys = ix*width+iy
+
+        # Work in cell order so the neighbour lookups are sorted too.
+        order = numpy.argsort(keys)
+        index = index[order]
+        keys = keys[order]
+        x = x[order]
+        y = y[order]
+        z = self.z[index]
+
+        crash = numpy.zeros(len(index),dtype=numpy.bool_)
+        warning = numpy.zeros(len(index),dtype=numpy.bool_)
+        for dx in (-1,0,1):
+            for dy in (-1,0,1):
+                neighbour = keys+dx*width+dy
+                start = numpy.searchsorted(keys,neighbour,'left')
+                counts = numpy.searchsorted(keys,neighbour,'right')-start
+                total = counts.sum()
+                if total==0:
+                    continue
+                i = numpy.repeat(numpy.arange(len(index)),counts)
+                j = numpy.arange(total)-numpy.repeat(numpy.cumsum(counts)-counts-start,counts)
+                keep = i<j
+                i = i[keep]
+                j = j[keep]
+
+                ddx = x[j]-x[i]
+                ddy = y[j]-y[i]
+                ddz = z[j]-z[i]
+                horizontal = ddx**2+ddy**2
+                crashed = numpy.sqrt(horizontal+ddz**2)<CRASH_DISTANCE
+                warned = ~crashed&(numpy.abs(ddz)<WARNING_ALTITUDE)&(horizontal<WARNING_DISTANCE**2)
+                crash[i[crashed]] = True
+                crash[j[crashed]] = True
+                warning[i[warned]] = True
+                warning[j[warned]] = True
+
+        crash_index = numpy.sort(index[crash])
+        warning_index = numpy.sort(index[warning])
+        return crash_index, warning_index
+
+    def remove(self,indices):
+        """Mark the aircraft at indices as no longer flying."""
+        self.alive[indices] = False
+
+class AirplaneView(object):
+    """One aircraft of a Fleet, with the methods of
+    airplane.ControllableAirplane. Commands are written straight into the
+    fleet arrays."""
+    def __init__(self,fleet,index):
+        self.fleet = fleet
+        self.index = index
+
+    def getName(self):
+        return self.fleet.getName(self.index)
+
+    def getPosition(self):
+        f, i = self.fleet, self.index
+        return vector.recvec(float(f.x[i]),float(f.y[i]),float(f.z[i]))
+
+    def getVelocity(self):
+        f, i = self.fleet, self.index
+        return vector.recvec(float(f.vx[i]),float(f.vy[i]),float(f.vz[i]))
+
+    def isControllable(self):
+        return True
+
+    def sendHeading(self,heading):
+        self.fleet.command_heading[self.index] = heading
+
+    def sendAltitude(self,altitude):
+        self.fleet.command_altitude[self.index] = altitude
+
+    def sendSpeed(self,speed):
+        self.fleet.command_speed[self.index] = speed
+
+    def getDesiredHeading(self):
+        return float(self.fleet.desired_heading[self.index])
+
+    def getDesiredSpeed(self):
+        return float(self.fleet.desired_speed[self.index])
+
+    def getDesiredAltitude(self):
+        return float(self.fleet.desired_altitude[self.index])
+
+def executeTimestep(airplane_list,deltat):
+    """Advance the airplanes in airplane_list with Fleet.executeTimestep,
+    in place of simcore.executeTimestep."""
+    fleet = Fleet.fromAirplanes(airplane_list)
+    fleet.executeTimestep(deltat)
+    for i, a in enumerate(airplane_list):
+        a.position = vector.recvec(*[float(v) for v in fleet.state[0:3,i]])
+        a.velocity = vector.recvec(*[float(v) for v in fleet.state[3:6,i]])
+
+def check_proximity(airplane_list):
+    """Return the crashed and too close airplanes of airplane_list found by
+    Fleet.check_proximity, in place of simcore.check_proximity."""
+    crash_index, warning_index = Fleet.fromAirplanes(airplane_list).check_proximity()
+    return ([airplane_list[i] for i in crash_index],
+            [airplane_list[i] for i in warning_index])
+
+def holdingPattern(fleet):
+    """Command every aircraft to keep turning at the maximum rate, so it
+    flies a circle of about 8.8 km radius and stays near where it started.
+    Used as the control for checkPrecision runs which must stay within
+    FLOAT32_RADIUS."""
+    heading = math.pi/2.0-numpy.arctan2(fleet.vy,fleet.vx)
+    fleet.command_heading[:] = (heading+math.pi/2.0)%(2.0*math.pi)
+
+def checkPrecision(fleet,ticks=6000,deltat=0.1,control=None):
+    """Run copies of fleet in float64 and float32 for the given number of
+    ticks, without crashes removing aircraft, and return a dictionary with
+    the largest position (meters) and velocity (meters per second) error of
+    the float32 run, the number of aircraft whose crash or warning status
+    differs on the last tick, the largest horizontal distance from the
+    origin reached during the run (meters), and whether that is within
+    FLOAT32_RADIUS. If control is given it is called with each copy every
+    100 ticks, as the flight controller would be."""
+    reference = fleet.astype(numpy.float64)
+    compact = fleet.astype(numpy.float32)
+    extent = 0.0
+    for t in range(ticks):
+        if control is not None and t%100==0:
+            control(reference)
+            control(compact)
+        reference.executeTimestep(deltat)
+        compact.executeTimestep(deltat)
+        extent = max(extent,float(numpy.hypot(reference.x,reference.y).max(initial=0.0)))
+
+    position_error = 0.0
+    velocity_error = 0.0
+    for field in ('x','y','z'):
+        diff = getattr(compact,field).astype(numpy.float64)-getattr(reference,field)
+        position_error = max(position_error,float(numpy.abs(diff).max(initial=0.0)))
+    for field in ('vx','vy','vz'):
+        diff = getattr(compact,field).astype(numpy.float64)-getattr(reference,field)
+        velocity_error = max(velocity_error,float(numpy.abs(diff).max(initial=0.0)))
+
+    ref_crash, ref_warning = reference.check_proximity()
+    crash, warning = compact.check_proximity()
+    status_differences = (len(numpy.setxor1d(ref_crash,crash))+
+                          len(numpy.setxor1d(ref_warning,warning)))
+
+    return {'position_error':position_error,'velocity_error':velocity_error,
+            'status_differences':status_differences,'extent':extent,
+            'within_float32_radius':extent<=FLOAT32_RADIUS}
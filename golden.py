@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+"""Golden trajectories for checking simulation engines. A golden file holds
+a fixed-seed scenario run through the reference engine (simcore): the
+position and velocity of every airplane, the sets of crashed and too close
+airplanes after each tick, and the final score and penalties. Any other
+engine providing executeTimestep(airplane_list,deltat) and
+check_proximity(airplane_list) can be run on the same scenario and compared
+against it, with the first divergent tick and airplane reported. An engine
+which takes coarser steps sets STEP to the number of ticks each of its steps
+covers, and is compared only on the ticks it reaches.
+
+The file starts with a small header and the airplane names, followed by a
+zlib compressed body. The body holds two bitmasks (crashed, too close) per
+tick with one bit per airplane, then six float64 values (x, y, z, vx, vy,
+vz) per airplane for every stride-th tick. Airplanes which are no longer
+flying are stored as NaN. Because states are only stored every stride-th
+tick, a state which drifts out of tolerance is reported at the next stored
+tick, along with the earliest tick it could have started on.
+
+Usage:
+    python golden.py record DIR [seed ...]
+    python golden.py check DIR [engine_module]"""
+import simcore
+import airplane
+import array
+import importlib
+import math
+import os
+import struct
+import sys
+import zlib
+
+MAGIC = b'FCGT'
+VERSION = 1
+HEADER = struct.Struct('<4sHIIIIiiI')
+FIELDS = ('x','y','z','vx','vy','vz')
+DEFAULT_SEEDS = (0,1,2,3,4)
+DEFAULT_TOLERANCES = {'x':1e-3,'y':1e-3,'z':1e-3,
+                      'vx':1e-6,'vy':1e-6,'vz':1e-6,
+                      'score':0}
+
+class ScriptedController(object):
+    """A fixed controller used for golden runs so they don't change when
+    flight_control.py does. For the first hold_calls calls the airplanes
+    keep their desired course, so the colliding pairs of the scenario crash.
+    After that it cycles each airplane through turns, climbs, descents, and
+    speed changes so all of the airplane limits are used."""
+    def __init__(self,hold_calls=31):
+        self.calls = 0
+        self.hold_calls = hold_calls
+
+    def executeControl(self,airplane_list):
+        if self.calls<self.hold_calls:
+            self.calls+=1
+            for a in airplane_list:
+                a.sendHeading(a.getDesiredHeading())
+                a.sendAltitude(a.getDesiredAltitude())
+                a.sendSpeed(a.getDesiredSpeed())
+            return
+        for i, a in enumerate(airplane_list):
+            k = self.calls+i
+            a.sendHeading((a.getDesiredHeading()+(k%5-2)*math.pi/9.0)%(2.0*math.pi))
+            a.sendAltitude(a.getDesiredAltitude()+(k%3-1)*800.0)
+            a.sendSpeed((airplane.ControllableAirplane.vmin,
+                         airplane.ControllableAirplane.vcruise,
+                         airplane.ControllableAirplane.vmax)[k%3])
+        self.calls+=1
+
+def createScenario(seed):
+    """Return the airplane list for the scenario with the given seed."""
+    simcore.seed(seed)
+    return simcore.createAirplaneList()
+
+def stateOf(a):
+    p = a.getPosition()
+    v = a.getVelocity()
+    return (p.x,p.y,p.z,v.x,v.y,v.z)
+
+def bitmask(indices,nbytes):
+    mask = bytearray(nbytes)
+    for i in indices:
+        mask[i//8] |= 1<<(i%8)
+    return bytes(mask)
+
+def maskIndices(mask):
+    return [i for i in range(len(mask)*8) if mask[i//8]&(1<<(i%8))]
+
+class Golden(object):
+    """A recorded golden trajectory. Use record() to make one, load() to
+    read one from a file, and compare() to check an engine against it."""
+    def __init__(self,seed,names,stride):
+        self.seed = seed
+        self.names = names
+        self.stride = stride
+        self.ticks = 0
+        self.score = 0
+        self.penalties = 0
+        self.masks = []
+        self.states = array.array('d')
+        self.index = {}
+        for i, name in enumerate(names):
+            self.index[name] = i
+
+    @property
+    def mask_bytes(self):
+        return (len(self.names)+7)//8
+
+    def crashed(self,tick):
+        """Return the indices of airplanes which crashed on tick."""
+        return maskIndices(self.masks[tick-1][0])
+
+    def warned(self,tick):
+        """Return the indices of airplanes too close to another on tick."""
+        return maskIndices(self.masks[tick-1][1])
+
+    def state(self,tick,i):
+        """Return the stored state of airplane i on tick, which must be a
+        multiple of the stride, or None if it was no longer flying."""
+        start = ((tick//self.stride-1)*len(self.names)+i)*len(FIELDS)
+        values = tuple(self.states[start:start+len(FIELDS)])
+        if math.isnan(values[0]):
+            return None
+        return values
+
+    def save(self,path):
+        header = HEADER.pack(MAGIC,VERSION,self.seed,self.ticks,self.stride,
+                             len(self.names),self.score,self.penalties,len(self.masks))
+        names = "\n".join(self.names).encode('utf-8')
+        body = b''.join(c+w for c, w in self.masks)
+        states = array.array('d',self.states)
+        if sys.byteorder!='little':
+            states.byteswap()
+        body += states.tobytes()
+        with open(path,"wb") as f:
+            f.write(header)
+            f.write(struct.pack('<I',len(names)))
+            f.write(names)
+            f.write(zlib.compress(body,9))
+
+    @classmethod
+    def load(cls,path):
+        with open(path,"rb") as f:
+            data = f.read()
+        magic, version, seed, ticks, stride, n, score, penalties, nmasks = HEADER.unpack_from(data)
+        if magic!=MAGIC or version!=VERSION:
+            raise ValueError("%s is not a version %d golden file"%(path,VERSION))
+        offset = HEADER.size
+        length, = struct.unpack_from('<I',data,offset)
+        offset+=4
+        names = data[offset:offset+length].decode('utf-8').split("\n")
+        offset+=length
+
+        golden = cls(seed,names,stride)
+        golden.ticks = ticks
+        golden.score = score
+        golden.penalties = penalties
+        body = zlib.decompress(data[offset:])
+        nbytes = golden.mask_bytes
+        for t in range(nmasks):
+            start = 2*nbytes*t
+            golden.masks.append((body[start:start+nbytes],body[start+nbytes:start+2*nbytes]))
+        golden.states.frombytes(body[2*nbytes*nmasks:])
+        if sys.byteorder!='little':
+            golden.states.byteswap()
+        return golden
+
+def record(seed,ticks=6000,stride=10,engine=None):
+    """Run the scenario for seed and return its Golden trajectory."""
+    airplane_list = createScenario(seed)
+    golden = Golden(seed,[a.getName() for a in airplane_list],stride)
+    nbytes = golden.mask_bytes
+    nan = (float('nan'),)*len(FIELDS)
+
+    def monitor(count,airplane_list,crash_list,warning_list,penalties):
+        golden.masks.append((bitmask([golden.index[a.getName()] for a in crash_list],nbytes),
+                             bitmask([golden.index[a.getName()] for a in warning_list],nbytes)))
+        if count%stride==0:
+            states = [nan]*len(golden.names)
+            for a in airplane_list:
+                states[golden.index[a.getName()]] = stateOf(a)
+            for s in states:
+                golden.states.extend(s)
+        return False
+
+    airplane_list, penalties, count = simcore.runSimulation(airplane_list,ScriptedController(),ticks,monitor=monitor,engine=engine)
+    golden.ticks = count
+    golden.penalties = penalties
+    golden.score = simcore.scoreGame(airplane_list,penalties,verbose=False)
+    return golden
+
+class Divergence(object):
+    """Where an engine first differs from a golden trajectory. name is None
+    for differences which don't belong to one airplane, like the score. The
+    difference was found on tick, and since is the first tick after the
+    last one compared, so it started somewhere from since to tick."""
+    def __init__(self,tick,name,field,expected,actual,since=None):
+        self.tick = tick
+        self.name = name
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+        if since is None:
+            since = tick
+        self.since = since
+
+    def __str__(self):
+        if self.since<self.tick:
+            where = "ticks %d-%d"%(self.since,self.tick)
+        else:
+            where = "tick %d"%self.tick
+        return "%s, %s, %s: expected %r, got %r"%(where,self.name,self.field,self.expected,self.actual)
+
+class Report(object):
+    """The result of comparing an engine with a golden trajectory."""
+    def __init__(self,seed,ticks,divergence=None):
+        self.seed = seed
+        self.ticks = ticks
+        self.divergence = divergence
+
+    @property
+    def ok(self):
+        return self.divergence is None
+
+    def __str__(self):
+        if self.ok:
+            return "seed %d: matches over %d ticks"%(self.seed,self.ticks)
+        return "seed %d: diverges at %s"%(self.seed,self.divergence)
+
+def compare(golden,engine,tolerances=None,step=None):
+    """Run the golden scenario with engine and return a Report. Each step of
+    the engine covers step ticks (by default engine.STEP, or 1 if it has
+    none), which must divide 100. Crashes and near-collisions must match
+    exactly on every tick the engine reaches. States are compared on the
+    ticks which are also stored in the golden file, and each field, and the
+    final score, may differ by the amount in tolerances (which defaults to
+    DEFAULT_TOLERANCES)."""
+    tol = dict(DEFAULT_TOLERANCES)
+    if tolerances is not None:
+        tol.update(tolerances)
+    if step is None:
+        step = getattr(engine,'STEP',1)
+    found = []
+    last_state = [0]
+
+    def diverge(tick,name,field,expected,actual,since=None):
+        found.append(Divergence(tick,name,field,expected,actual,since))
+        return True
+
+    def checkSet(tick,field,expected,planes):
+        actual = sorted(golden.index[a.getName()] for a in planes)
+        if actual==expected:
+            return False
+        i = min(set(actual)^set(expected))
+        return diverge(tick,golden.names[i],field,i in expected,i in actual,tick-step+1)
+
+    def monitor(count,airplane_list,crash_list,warning_list,penalties):
+        if count>golden.ticks:
+            return diverge(count,None,'ticks',golden.ticks,count)
+        if checkSet(count,'crash',golden.crashed(count),crash_list):
+            return True
+        if checkSet(count,'warning',golden.warned(count),warning_list):
+            return True
+        if count%golden.stride!=0:
+            return False
+
+        since = last_state[0]+1
+        last_state[0] = count
+        actual = {}
+        for a in airplane_list:
+            actual[golden.index[a.getName()]] = stateOf(a)
+        for i, name in enumerate(golden.names):
+            expected = golden.state(count,i)
+            if (expected is None)!=(i not in actual):
+                return diverge(count,name,'flying',expected is not None,i in actual,since)
+            if expected is None:
+                continue
+            for field, e, a in zip(FIELDS,expected,actual[i]):
+                if abs(e-a)>tol[field]:
+                    return diverge(count,name,field,e,a,since)
+        return False
+
+    airplane_list = createScenario(golden.seed)
+    airplane_list, penalties, count = simcore.runSimulation(airplane_list,ScriptedController(),golden.ticks,
+                                                           monitor=monitor,engine=engine,step=step)
+    if not found:
+        if penalties!=golden.penalties:
+            diverge(count,None,'penalties',golden.penalties,penalties)
+        else:
+            score = simcore.scoreGame(airplane_list,penalties,verbose=False)
+            if abs(score-golden.score)>tol['score']:
+                diverge(count,None,'score',golden.score,score)
+    if found:
+        return Report(golden.seed,found[0].tick,found[0])
+    return Report(golden.seed,count)
+
+def goldenPath(directory,seed):
+    return os.path.join(directory,"seed%d.golden"%seed)
+
+def main():
+    if len(sys.argv)<3 or sys.argv[1] not in ('record','check'):
+        print(__doc__.split("Usage:")[1])
+        sys.exit(2)
+    directory = sys.argv[2]
+
+    if sys.argv[1]=='record':
+        seeds = [int(s) for s in sys.argv[3:]] or DEFAULT_SEEDS
+        os.makedirs(directory,exist_ok=True)
+        for seed in seeds:
+            path = goldenPath(directory,seed)
+            golden = record(seed)
+            golden.save(path)
+            print("Wrote",path,os.path.getsize(path),"bytes")
+    else:
+        engine = simcore
+        if len(sys.argv)>3:
+            engine = importlib.import_module(sys.argv[3])
+        failed = False
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".golden"):
+                report = compare(Golden.load(os.path.join(directory,filename)),engine)
+                print(report)
+                failed = failed or not report.ok
+        if failed:
+            sys.exit(1)
+
+if __name__=="__main__":
+    main()
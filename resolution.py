@@ -0,0 +1,403 @@
+"""Conflict resolution library for the flight controller. Encounters between
+pairs of airplanes are reduced to a quantized geometry (relative bearing,
+closing speed, altitude difference, time to closest approach, and the room
+the own airplane has to climb and descend). A search is made for a heading,
+altitude, and speed manoeuvre which resolves the encounter within the limits
+of airplane.ControllableAirplane, and the result is stored in a cache keyed
+on the quantized geometry so that repeated encounters do not have to be
+searched again.
+
+Only one airplane of a pair manoeuvres, the other keeps its course as the
+search assumes. The manoeuvre is flown relative to the course the airplane
+had when the conflict was first found, and is held until the pair have
+passed their closest approach."""
+import airplane
+import vector
+import math
+import collections
+import json
+import os
+
+WARNING_DISTANCE = 10000.0 # horizontal separation required, meters
+WARNING_ALTITUDE = 600.0 # vertical separation required, meters
+
+BEARING_STEP = 15.0*math.pi/180.0 # radians
+CLOSING_STEP = 40.0 # meters per second
+ALTITUDE_STEP = 200.0 # meters
+TCA_STEP = 15.0 # seconds, time to closest approach buckets double in length
+HEADROOM_STEP = 200.0 # meters
+MAX_HEADROOM = 1000.0 # meters, the largest altitude change searched
+STEPS = [BEARING_STEP,CLOSING_STEP,ALTITUDE_STEP,TCA_STEP,HEADROOM_STEP,MAX_HEADROOM]
+
+class Manoeuvre(object):
+    """A resolution manoeuvre given relative to a reference heading and
+    altitude, the airplane's course when the encounter geometry was taken.
+    The heading change is in radians, the altitude change is in meters, and
+    the speed is in meters per second."""
+    def __init__(self,delta_heading=0.0,delta_altitude=0.0,speed=airplane.ControllableAirplane.vcruise):
+        self.delta_heading = delta_heading
+        self.delta_altitude = delta_altitude
+        self.speed = speed
+
+    def __repr__(self):
+        return "Manoeuvre(%g,%g,%g)"%(self.delta_heading,self.delta_altitude,self.speed)
+
+    def __eq__(self,other):
+        return (self.delta_heading==other.delta_heading and
+                self.delta_altitude==other.delta_altitude and
+                self.speed==other.speed)
+
+    def apply(self,a,reference=None):
+        """Send the commands for this manoeuvre to the airplane a. reference
+        is the (heading, altitude) the manoeuvre is relative to, by default
+        the current course of a. The altitude is kept within the airplane
+        limits."""
+        if reference is None:
+            reference = currentCourse(a)
+        heading, altitude = reference
+        altitude = min(max(altitude+self.delta_altitude,airplane.ControllableAirplane.alt_min),
+                       airplane.ControllableAirplane.alt_max)
+        a.sendHeading((heading+self.delta_heading)%(2.0*math.pi))
+        a.sendAltitude(altitude)
+        a.sendSpeed(self.speed)
+
+    def cost(self):
+        """How far the manoeuvre takes the airplane from its current
+        course. Used to choose between manoeuvres which both resolve a
+        conflict."""
+        return (abs(self.delta_heading)/(math.pi/12.0)+
+                abs(self.delta_altitude)/300.0+
+                abs(self.speed-airplane.ControllableAirplane.vcruise)/10.0)
+
+    def toList(self):
+        return [self.delta_heading,self.delta_altitude,self.speed]
+
+    @classmethod
+    def fromList(cls,values):
+        return cls(*values)
+
+def currentCourse(a):
+    """Return the current heading and altitude of a."""
+    return (math.pi/2.0-a.getVelocity().phi)%(2.0*math.pi), a.getPosition().z
+
+def headroom(altitude):
+    """Return how far an airplane at altitude can climb and descend, each
+    capped at MAX_HEADROOM."""
+    up = airplane.ControllableAirplane.alt_max-altitude
+    down = altitude-airplane.ControllableAirplane.alt_min
+    return (min(max(up,0.0),MAX_HEADROOM),min(max(down,0.0),MAX_HEADROOM))
+
+def encounterGeometry(own,intruder):
+    """Return the geometry of an encounter as seen from the airplane own.
+    The result is a tuple of the relative bearing of the intruder (radians
+    from the own heading, between -pi and pi), the closing speed (meters per
+    second, positive when approaching), the altitude of the intruder above
+    own (meters), the time to closest horizontal approach (seconds), and the
+    room own has to climb and to descend (meters, see headroom())."""
+    dpos = intruder.getPosition()-own.getPosition()
+    dvel = intruder.getVelocity()-own.getVelocity()
+    dz = dpos.z
+    dpos.z = 0.0
+    dvel.z = 0.0
+
+    heading = math.pi/2.0-own.getVelocity().phi
+    bearing = (math.pi/2.0-dpos.phi)-heading
+    bearing = math.atan2(math.sin(bearing),math.cos(bearing))
+
+    distance = abs(dpos)
+    if distance>0.0:
+        closing = -(dpos*dvel)/distance
+    else:
+        closing = abs(dvel)
+
+    vsq = dvel*dvel
+    if vsq>0.0:
+        tca = max(0.0,-(dpos*dvel)/vsq)
+    else:
+        tca = 0.0
+
+    up, down = headroom(own.getPosition().z)
+    return bearing, closing, dz, tca, up, down
+
+def quantize(geometry):
+    """Return the cache key for an encounter geometry. An intruder on the
+    left is the mirror image of one on the right, so only the size of the
+    bearing is kept and Resolver.resolve() mirrors the manoeuvre. Airplanes
+    moving apart all have a closing speed of zero, the same as the
+    representative encounter gives them. The time to closest approach is
+    bucketed on a log scale, 0-15 s, 15-45 s, 45-105 s and so on, since the
+    choice of manoeuvre depends less on it the further away the encounter
+    is. Headroom is rounded down, so the search never has more room than the
+    airplane."""
+    bearing, closing, dz, tca, up, down = geometry
+    return (int(round(abs(bearing)/BEARING_STEP)),
+            int(round(max(closing,0.0)/CLOSING_STEP)),
+            int(round(dz/ALTITUDE_STEP)),
+            int(math.log2(1.0+tca/TCA_STEP)),
+            int(up//HEADROOM_STEP),
+            int(down//HEADROOM_STEP))
+
+def dequantize(key):
+    """Return the representative encounter geometry for a cache key."""
+    return (key[0]*BEARING_STEP,key[1]*CLOSING_STEP,key[2]*ALTITUDE_STEP,
+            TCA_STEP*(2.0**(key[3]+0.5)-1.0),
+            key[4]*HEADROOM_STEP,key[5]*HEADROOM_STEP)
+
+def canonicalEncounter(key):
+    """Build the representative encounter for a cache key. The own airplane
+    starts at the origin flying North at cruise speed, at cruise altitude
+    unless that would give it more headroom than the key. The intruder is an
+    airplane.FlyingObject placed on a collision course at the given bearing
+    so that it arrives at the time of closest approach."""
+    bearing, closing, dz, tca, up, down = dequantize(key)
+    vcruise = airplane.ControllableAirplane.vcruise
+    if up<MAX_HEADROOM:
+        alt = airplane.ControllableAirplane.alt_max-up
+    elif down<MAX_HEADROOM:
+        alt = airplane.ControllableAirplane.alt_min+down
+    else:
+        alt = airplane.ControllableAirplane.alt_cruise
+
+    own_velocity = vector.sphvec(vcruise,math.pi/2.0,math.pi/2.0)
+    own = airplane.ControllableAirplane("own",vector.recvec(0.0,0.0,alt),own_velocity)
+
+    direction = vector.sphvec(1.0,math.pi/2.0,math.pi/2.0-bearing)
+    distance = max(closing,0.0)*tca
+    intruder_position = direction*distance+vector.recvec(0.0,0.0,alt+dz)
+    intruder_velocity = own_velocity-direction*closing
+    intruder = airplane.FlyingObject("intruder",intruder_position,intruder_velocity)
+
+    return own, intruder
+
+class ResolutionCache(object):
+    """A least recently used cache of resolution manoeuvres keyed on
+    quantized encounter geometry. If path is given the cache is warm-started
+    from that file, and save() will write it back."""
+    def __init__(self,maxsize=4096,path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self,key):
+        return key in self.entries
+
+    def get(self,key):
+        """Return the manoeuvre stored for key, or None if there is none."""
+        try:
+            manoeuvre = self.entries[key]
+        except KeyError:
+            self.misses+=1
+            return None
+        self.entries.move_to_end(key)
+        self.hits+=1
+        return manoeuvre
+
+    def put(self,key,manoeuvre):
+        """Store a manoeuvre, evicting the least recently used entry if the
+        cache is full."""
+        self.entries[key] = manoeuvre
+        self.entries.move_to_end(key)
+        while len(self.entries)>self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions+=1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Return a dictionary of cache statistics."""
+        lookups = self.hits+self.misses
+        if lookups>0:
+            hit_rate = self.hits/lookups
+        else:
+            hit_rate = 0.0
+        return {'size':len(self.entries),'maxsize':self.maxsize,
+                'hits':self.hits,'misses':self.misses,
+                'evictions':self.evictions,'hit_rate':hit_rate}
+
+    def save(self,path=None):
+        """Write the cache entries to path (or the path the cache was
+        created with) as JSON, least recently used first."""
+        if path is None:
+            path = self.path
+        if path is None:
+            raise ValueError("No path given to save the resolution cache")
+        data = {'version':3,
+                'steps':STEPS,
+                'entries':[[list(k),m.toList()] for k, m in self.entries.items()]}
+        tmp = path+".tmp"
+        with open(tmp,"w") as f:
+            json.dump(data,f)
+        os.replace(tmp,path)
+
+    def load(self,path):
+        """Add the entries stored in path to the cache. Files written with
+        different quantization steps are ignored."""
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version')!=3:
+            return
+        if data.get('steps')!=STEPS:
+            return
+        for k, m in data['entries']:
+            self.put(tuple(k),Manoeuvre.fromList(m))
+
+class Encounter(object):
+    """A conflict an airplane is resolving: the intruder's name, the
+    (heading, altitude) reference the manoeuvre is flown from, and the
+    manoeuvre."""
+    def __init__(self,intruder,reference,manoeuvre):
+        self.intruder = intruder
+        self.reference = reference
+        self.manoeuvre = manoeuvre
+
+class Resolver(object):
+    """Finds resolution manoeuvres for pairs of airplanes, using a
+    ResolutionCache to avoid repeating the search for encounters which have
+    the same quantized geometry. encounters maps the names of airplanes
+    resolving a conflict to their Encounter, for resolveConflicts()."""
+    heading_changes = [x*math.pi/180.0 for x in (0.0,15.0,-15.0,30.0,-30.0,45.0,-45.0,60.0,-60.0,90.0,-90.0)]
+    altitude_changes = [0.0,800.0,-800.0,1000.0,-1000.0]
+    speeds = [airplane.ControllableAirplane.vcruise,
+              airplane.ControllableAirplane.vmin,
+              airplane.ControllableAirplane.vmax]
+
+    def __init__(self,cache=None,lookahead=300.0,timestep=1.0):
+        if cache is None:
+            cache = ResolutionCache()
+        self.cache = cache
+        self.lookahead = lookahead
+        self.timestep = timestep
+        self.encounters = {}
+
+    def resolve(self,own,intruder):
+        """Return the manoeuvre own should fly, from its current course, to
+        avoid intruder flying straight."""
+        geometry = encounterGeometry(own,intruder)
+        key = quantize(geometry)
+        manoeuvre = self.cache.get(key)
+        if manoeuvre is None:
+            manoeuvre = self.search(key)
+            self.cache.put(key,manoeuvre)
+        if geometry[0]<0.0:
+            manoeuvre = Manoeuvre(-manoeuvre.delta_heading,manoeuvre.delta_altitude,manoeuvre.speed)
+        return manoeuvre
+
+    def candidates(self):
+        """Return every manoeuvre searched, cheapest first."""
+        result = []
+        for dh in Resolver.heading_changes:
+            for dz in Resolver.altitude_changes:
+                for speed in Resolver.speeds:
+                    result.append(Manoeuvre(dh,dz,speed))
+        result.sort(key=lambda m: m.cost())
+        return result
+
+    def search(self,key):
+        """Search for the cheapest manoeuvre which keeps the representative
+        encounter for key out of the warning zone. If no manoeuvre avoids it
+        entirely the one with the least time in the warning zone is used."""
+        best = None
+        best_score = None
+        for manoeuvre in self.candidates():
+            score = (self.conflictTime(key,manoeuvre),manoeuvre.cost())
+            if best_score is None or score<best_score:
+                best = manoeuvre
+                best_score = score
+            if score[0]==0.0:
+                break
+        return best
+
+    def conflictTime(self,key,manoeuvre):
+        """Fly the representative encounter for key with own following the
+        manoeuvre, and return the number of seconds spent in the warning
+        zone."""
+        own, intruder = canonicalEncounter(key)
+        manoeuvre.apply(own)
+        duration = max(self.lookahead,dequantize(key)[3]+60.0)
+        nsteps = int(duration/self.timestep)
+        conflict = 0.0
+        for i in range(nsteps):
+            own.executeTimestep(self.timestep)
+            intruder.executeTimestep(self.timestep)
+            d = intruder.getPosition()-own.getPosition()
+            if abs(d.z)<WARNING_ALTITUDE and d.x**2+d.y**2<WARNING_DISTANCE**2:
+                conflict+=self.timestep
+        return conflict
+
+def predictConflict(a,b,lookahead=300.0):
+    """Return the time of closest horizontal approach if a and b, flying
+    straight, will lose separation within lookahead seconds, otherwise
+    return None."""
+    dpos = b.getPosition()-a.getPosition()
+    dvel = b.getVelocity()-a.getVelocity()
+
+    vsq = dvel.x**2+dvel.y**2
+    if vsq>0.0:
+        tca = -(dpos.x*dvel.x+dpos.y*dvel.y)/vsq
+        tca = min(max(tca,0.0),lookahead)
+    else:
+        tca = 0.0
+    closest = dpos+dvel*tca
+    if abs(closest.z)<WARNING_ALTITUDE and closest.x**2+closest.y**2<WARNING_DISTANCE**2:
+        return tca
+    return None
+
+def passed(a,b):
+    """Return True if a and b are no longer closing horizontally."""
+    dpos = b.getPosition()-a.getPosition()
+    dvel = b.getVelocity()-a.getVelocity()
+    return dpos.x*dvel.x+dpos.y*dvel.y>=0.0
+
+def resolveConflicts(airplane_list,resolver,lookahead=300.0):
+    """Send every airplane in airplane_list either the manoeuvre resolving
+    its most imminent predicted conflict, or its desired heading, altitude,
+    and speed if it has none. Once an airplane starts a manoeuvre it keeps
+    flying it, from the same reference course, until it has passed the
+    intruder or a conflict with another airplane is found, and the intruder
+    does not manoeuvre for it. This is meant to be called from
+    FlightController.executeControl with the same resolver every time."""
+    by_name = {}
+    for a in airplane_list:
+        by_name[a.getName()] = a
+    for name in list(resolver.encounters):
+        encounter = resolver.encounters[name]
+        if (name not in by_name or encounter.intruder not in by_name or
+            passed(by_name[name],by_name[encounter.intruder])):
+            del resolver.encounters[name]
+
+    for a in airplane_list:
+        encounter = resolver.encounters.get(a.getName())
+        intruder = None
+        first = None
+        for b in airplane_list:
+            if b is a or (encounter is not None and b.getName()==encounter.intruder):
+                continue
+            other = resolver.encounters.get(b.getName())
+            if other is not None and other.intruder==a.getName():
+                continue
+            tca = predictConflict(a,b,lookahead)
+            if tca is not None and (first is None or tca<first):
+                intruder = b
+                first = tca
+        if intruder is not None:
+            encounter = Encounter(intruder.getName(),currentCourse(a),resolver.resolve(a,intruder))
+            resolver.encounters[a.getName()] = encounter
+
+        if encounter is None:
+            a.sendHeading(a.getDesiredHeading())
+            a.sendAltitude(a.getDesiredAltitude())
+            a.sendSpeed(a.getDesiredSpeed())
+        else:
+            encounter.manoeuvre.apply(a,encounter.reference)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+"""Sharded airspace simulation. The airspace is split into strips running
+North-South, and each strip (sector) is simulated by its own worker process
+using the normal airplane.ControllableAirplane physics and a local
+proximity check. Airplanes which fly across a sector edge are handed off to
+the neighbouring worker. Each worker also sees a halo of the airplanes in
+the neighbouring sectors within the 10 km warning distance of its edges, so
+conflicts across sector boundaries are still detected.
+
+Workers exchange handoffs and halo positions directly with their two
+neighbours through queues, and that exchange is the tick barrier: a worker
+can't check proximity for a tick until both neighbours have stepped to it.
+The main process is only involved every 100 ticks, when it gathers the
+airplanes, runs the controller on the full list in the same order a single
+process run would give it, and sends the new commands back. The results
+match simcore.runSimulation. The airplane objects passed to the controller
+are copies which change from call to call, so a controller keeping state
+between calls should track airplanes by getName().
+
+Run "python shardsim.py bench" to measure ticks per second against the
+number of sectors. Sectors must be wider than the halo, which allows up to
+13 sectors across the radar area.
+
+Usage:
+    python shardsim.py [nsectors] [seed]
+    python shardsim.py bench [naircraft] [ticks] [nsectors ...]"""
+import simcore
+import airplane
+import vector
+import flight_control
+import math
+import multiprocessing
+import sys
+import time
+
+HALO_WIDTH = 10000.0 # warning distance, meters
+CONTROL_INTERVAL = 100 # ticks between controller calls
+
+class SectorLayout(object):
+    """Divides the radar area into nsectors strips of equal width along the
+    x-axis. The first and last sectors extend to infinity so airplanes
+    leaving the radar area still belong to a sector. Strips must be wider
+    than the halo so that only neighbouring sectors share a halo."""
+    def __init__(self,nsectors,radius=simcore.RADAR_RADIUS,halo=HALO_WIDTH):
+        self.nsectors = nsectors
+        self.radius = radius
+        self.halo = halo
+        self.width = 2.0*radius/nsectors
+        if self.width<=halo:
+            raise ValueError("Sectors must be wider than the %g m halo, so at most %d fit in a radius of %g m"%(
+                halo,int(math.ceil(2.0*radius/halo))-1,radius))
+
+    def sectorOf(self,x):
+        """Return the sector containing x."""
+        s = int((x+self.radius)//self.width)
+        if s<0:
+            s = 0
+        elif s>=self.nsectors:
+            s = self.nsectors-1
+        return s
+
+    def haloSectors(self,x):
+        """Return the sectors which are within the halo width of x, including
+        the sector containing x."""
+        return range(self.sectorOf(x-self.halo),self.sectorOf(x+self.halo)+1)
+
+    def neighbours(self,sector):
+        return [s for s in (sector-1,sector+1) if 0<=s<self.nsectors]
+
+def sectorWorker(conn,sector,layout,owned,deltat,inboxes,outboxes):
+    """Main loop of a sector worker process. Commands from the main process
+    arrive on conn. inboxes and outboxes map each neighbouring sector to
+    the queue carrying its messages to and from this one."""
+    while True:
+        msg = conn.recv()
+        command = msg[0]
+        if command=='run':
+            count, nticks = msg[1], msg[2]
+            penalties = 0
+            for t in range(nticks):
+                count+=1
+                simcore.executeTimestep(owned,deltat)
+
+                staying = []
+                local_halo = []
+                outgoing = {}
+                for s in outboxes:
+                    outgoing[s] = ([],[])
+                for p in owned:
+                    pos = p.getPosition()
+                    s = layout.sectorOf(pos.x)
+                    if s==sector:
+                        staying.append(p)
+                    else:
+                        outgoing[s][0].append(p)
+                    for h in layout.haloSectors(pos.x):
+                        if h==s:
+                            continue
+                        if h==sector:
+                            local_halo.append(p)
+                        else:
+                            outgoing[h][1].append((p.getName(),pos.x,pos.y,pos.z))
+                owned = staying
+                for s, q in outboxes.items():
+                    q.put(outgoing[s])
+
+                halo = local_halo
+                for s, q in inboxes.items():
+                    immigrants, positions = q.get()
+                    owned.extend(immigrants)
+                    for name, x, y, z in positions:
+                        halo.append(airplane.FlyingObject(name,vector.recvec(x,y,z)))
+
+                crash_list, warning_list = simcore.check_proximity(owned+halo)
+                owned_ids = set(id(p) for p in owned)
+                crashed_ids = set(id(p) for p in crash_list if id(p) in owned_ids)
+                penalties+=1000*len(crashed_ids)
+                if count%CONTROL_INTERVAL==0 and count>=1000:
+                    penalties+=100*sum(1 for p in warning_list if id(p) in owned_ids)
+                owned = [p for p in owned if id(p) not in crashed_ids]
+            conn.send((penalties,owned))
+        elif command=='command':
+            commands = msg[1]
+            for p in owned:
+                p.commandHeading, p.commandSpeed, p.commandAltitude = commands[p.getName()]
+        elif command=='stop':
+            conn.close()
+            return
+
+class ShardedSimulation(object):
+    """Runs the simulation with the airspace split across nsectors worker
+    processes. Use run() to simulate, then close() to stop the workers."""
+    def __init__(self,airplane_list,controller,nsectors,deltat=0.1):
+        self.layout = SectorLayout(nsectors)
+        self.controller = controller
+        self.count = 0
+        self.penalties = 0
+        self.airplane_list = list(airplane_list)
+        self.order = {}
+        for i, p in enumerate(airplane_list):
+            self.order[p.getName()] = i
+
+        self.controller.executeControl(list(airplane_list))
+
+        sectors = [[] for s in range(nsectors)]
+        for p in airplane_list:
+            sectors[self.layout.sectorOf(p.getPosition().x)].append(p)
+
+        queues = {}
+        for s in range(nsectors):
+            for n in self.layout.neighbours(s):
+                queues[(s,n)] = multiprocessing.Queue()
+
+        self.conns = []
+        self.processes = []
+        for s in range(nsectors):
+            inboxes = dict((n,queues[(n,s)]) for n in self.layout.neighbours(s))
+            outboxes = dict((n,queues[(s,n)]) for n in self.layout.neighbours(s))
+            parent, child = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=sectorWorker,
+                                           args=(child,s,self.layout,sectors[s],deltat,inboxes,outboxes))
+            proc.daemon = True
+            proc.start()
+            child.close()
+            self.conns.append(parent)
+            self.processes.append(proc)
+
+    def ordered(self,sectors):
+        """Merge the airplanes from all sectors in their original order."""
+        airplane_list = [p for owned in sectors for p in owned]
+        airplane_list.sort(key=lambda p: self.order[p.getName()])
+        return airplane_list
+
+    def run(self,ticks=6000):
+        """Run the simulation following the schedule of
+        simcore.runSimulation. ticks counts from the start of the
+        simulation, so run() can be called again to carry on. Returns the
+        remaining airplanes, the penalties, and the number of ticks run,
+        both since the start."""
+        while self.count<ticks:
+            nticks = min(CONTROL_INTERVAL-self.count%CONTROL_INTERVAL,ticks-self.count)
+            for c in self.conns:
+                c.send(('run',self.count,nticks))
+            sectors = []
+            for c in self.conns:
+                sector_penalties, owned = c.recv()
+                self.penalties+=sector_penalties
+                sectors.append(owned)
+            self.count+=nticks
+            self.airplane_list = self.ordered(sectors)
+
+            if self.count%CONTROL_INTERVAL==0:
+                self.controller.executeControl(list(self.airplane_list))
+                for c, owned in zip(self.conns,sectors):
+                    commands = {}
+                    for p in owned:
+                        commands[p.getName()] = (p.commandHeading,p.commandSpeed,p.commandAltitude)
+                    c.send(('command',commands))
+
+        return self.airplane_list, self.penalties, self.count
+
+    def close(self):
+        for c in self.conns:
+            c.send(('stop',))
+        for proc in self.processes:
+            proc.join()
+        for c in self.conns:
+            c.close()
+
+def runSharded(airplane_list,nsectors,ticks=6000):
+    """Run airplane_list across nsectors workers with the sample flight
+    controller and return the remaining airplanes, the penalties, and the
+    ticks run."""
+    sim = ShardedSimulation(airplane_list,flight_control.FlightController(),nsectors)
+    try:
+        return sim.run(ticks)
+    finally:
+        sim.close()
+
+def runSingle(airplane_list,ticks=6000):
+    """Run airplane_list in this process, as a reference for runSharded."""
+    return simcore.runSimulation(airplane_list,flight_control.FlightController(),ticks)
+
+def createScenario(seed):
+    """Return the standard scenario for seed."""
+    simcore.seed(seed)
+    return simcore.createAirplaneList()
+
+def createFleet(naircraft,seed=0):
+    """Return naircraft airplanes spread uniformly over the radar area at
+    random altitudes and headings, for benchmarking."""
+    simcore.seed(seed)
+    random = simcore.numpyRandom()
+    airplane_list = []
+    for i in range(naircraft):
+        rho = simcore.RADAR_RADIUS*math.sqrt(random.random_sample())
+        phi = random.random_sample()*2.0*math.pi
+        altitude = airplane.ControllableAirplane.alt_min+random.random_sample()*(
+            airplane.ControllableAirplane.alt_max-airplane.ControllableAirplane.alt_min)
+        heading = random.random_sample()*2.0*math.pi
+        position = vector.cylvec(rho,phi,altitude)
+        velocity = vector.sphvec(airplane.ControllableAirplane.vcruise,math.pi/2.0,math.pi/2.0-heading)
+        airplane_list.append(airplane.ControllableAirplane("F%d"%i,position,velocity))
+    return airplane_list
+
+def sameResult(a,b):
+    """Return True if two (airplanes, penalties, ticks) results match."""
+    return ([p.getName() for p in a[0]]==[p.getName() for p in b[0]] and
+            all(p.getPosition()==q.getPosition() for p, q in zip(a[0],b[0])) and
+            a[1]==b[1])
+
+def benchmark(naircraft=600,ticks=200,sector_counts=(1,2,4,8)):
+    """Print ticks per second for a fleet of naircraft run in a single
+    process and across each number of sectors, and check every sharded run
+    matches the single process one."""
+    print("%d aircraft, %d ticks, %d cores"%(naircraft,ticks,multiprocessing.cpu_count()))
+    start = time.perf_counter()
+    reference = runSingle(createFleet(naircraft),ticks)
+    single = ticks/(time.perf_counter()-start)
+    print("single process: %8.1f ticks/s"%single)
+    matched = True
+    for nsectors in sector_counts:
+        start = time.perf_counter()
+        result = runSharded(createFleet(naircraft),nsectors,ticks)
+        rate = ticks/(time.perf_counter()-start)
+        same = sameResult(reference,result)
+        matched = matched and same
+        print("%2d sectors:     %8.1f ticks/s  %5.2fx  %s"%(nsectors,rate,rate/single,"match" if same else "DIFFER"))
+    return matched
+
+def main():
+    if len(sys.argv)>1 and sys.argv[1]=='bench':
+        naircraft = 600
+        ticks = 200
+        sector_counts = (1,2,4,8)
+        if len(sys.argv)>2:
+            naircraft = int(sys.argv[2])
+        if len(sys.argv)>3:
+            ticks = int(sys.argv[3])
+        if len(sys.argv)>4:
+            sector_counts = [int(n) for n in sys.argv[4:]]
+        if not benchmark(naircraft,ticks,sector_counts):
+            sys.exit(1)
+        return
+
+    nsectors = 4
+    seed = 0
+    if len(sys.argv)>1:
+        nsectors = int(sys.argv[1])
+    if len(sys.argv)>2:
+        seed = int(sys.argv[2])
+
+    single = runSingle(createScenario(seed))
+    sharded = runSharded(createScenario(seed),nsectors)
+    single_score = simcore.scoreGame(single[0],single[1],verbose=False)
+    sharded_score = simcore.scoreGame(sharded[0],sharded[1],verbose=False)
+    print("Single process score:",single_score)
+    print("Sharded score (%d sectors):"%nsectors,sharded_score)
+
+    if sameResult(single,sharded):
+        print("Results match.")
+    else:
+        print("Results differ.")
+        sys.exit(1)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Simulation helpers which don't need a window. The proximity check,
+timestep, scenario creation, scoring, and a headless simulation loop live
+here so worker processes and tools can use them without importing tkinter.
+numpy.random, which takes longer to import than everything else here put
+together, is only imported when a scenario is first created.
+
+Importing this module should stay under IMPORT_TIME_BUDGET seconds; run
+"python simcore.py" to measure it. startWorkers() gives a pool of worker
+processes which do their imports once and then serve many runs."""
+import airplane
+import vector
+import math
+import sys
+import itertools
+
+RADAR_RADIUS = 70000.0 # range of radar
+IMPORT_TIME_BUDGET = 0.05 # seconds
+
+_random = None
+
+def numpyRandom():
+    """Return the numpy.random module, importing it on first use."""
+    global _random
+    if _random is None:
+        import numpy.random
+        _random = numpy.random
+    return _random
+
+def seed(value):
+    """Seed the random number generator used to create scenarios."""
+    numpyRandom().seed(value)
+
+def check_proximity(airplane_list):
+    warning_list = []
+    crash_list = []
+    remaining_list = list(airplane_list)
+
+    for o1, o2 in itertools.combinations(remaining_list, 2):
+        dist = o2.getPosition()-o1.getPosition()
+        if abs(dist)<100.0:
+            if o1 not in crash_list:
+                crash_list.append(o1)
+            if o2 not in crash_list:
+                crash_list.append(o2)
+        elif abs(dist.z)<600.0 and (dist.x**2+dist.y**2)<10000.0**2:
+            if o1 not in warning_list:
+                warning_list.append(o1)
+            if o2 not in warning_list:
+                warning_list.append(o2)
+
+    return crash_list, warning_list
+
+def executeTimestep(airplane_list,deltat):
+    for o in airplane_list:
+        o.executeTimestep(deltat)
+
+def createAirplaneList():
+    names = createNameList()
+    p1, p2 = generateCollidingPair(0.0,10000.0,8000.0,names.pop(),names.pop(),200.0)
+    p3, p4 = generateCollidingPair(0.0,0.0,8000.0,names.pop(),names.pop(),250.0)
+    p5, p6 = generateCollidingPair(10000,0.0,7000.0,names.pop(),names.pop(),300.0)
+    p7 = generateRandomPlane(names.pop(),8000.0)
+    p8 = generateRandomPlane(names.pop(),7000.0)
+    p9 = generateRandomPlane(names.pop(),6000.0)
+    p10 = generateRandomPlane(names.pop(),8000.0)
+
+    return [p1,p2,p3,p4,p5,p6,p7,p8,p9,p10]
+    
+def generateCollidingPair(x,y,z,name1,name2,tcollision):
+    """Create a set of airplanes which will collide at position x, y, z in tcollision seconds"""
+    random = numpyRandom()
+    crashpos = vector.recvec(x,y,z)
+
+    phi1 = -math.pi+random.random_sample()*2.0*math.pi
+    phi2 = -math.pi+random.random_sample()*2.0*math.pi
+    v = airplane.ControllableAirplane.vcruise
+
+    v1 = vector.sphvec(v,math.pi/2.0,phi1)
+    v2 = vector.sphvec(v,math.pi/2.0,phi2)
+    pos1 = crashpos-v1*tcollision
+    pos2 = crashpos-v2*tcollision
+
+    airplane1 = airplane.ControllableAirplane(name1,pos1,v1)
+    airplane2 = airplane.ControllableAirplane(name2,pos2,v2)
+
+    return airplane1, airplane2
+
+def generateRandomPlane(name,altitude):
+    random = numpyRandom()
+    phi = -math.pi+random.random_sample()*2.0*math.pi
+    dir_flight = phi+3.0*math.pi/4.0+random.random_sample()*math.pi/2.0
+
+    position = vector.cylvec(70000.0,phi,altitude)
+    velocity = vector.sphvec(airplane.ControllableAirplane.vcruise,math.pi/2.0,dir_flight)
+
+    return airplane.ControllableAirplane(name,position,velocity)
+
+def createNameList():
+    random = numpyRandom()
+    callsigns = ['United','American','Delta','N']
+    names=[]
+    for i in range(10000):
+        names.append(callsigns[i%len(callsigns)]+str(i))
+
+    random.shuffle(names)
+    return names
+
+def scoreGame(airplane_list,penalties,verbose=True):
+    score = 0
+    if verbose:
+        print(penalties,"points to deduct for penalties.")
+    for a in airplane_list:
+        score+=1000 # Airplane is still there
+        if verbose:
+            print(a.getName(), end=' ')
+        v = a.getVelocity()
+        p = a.getPosition()
+        heading = math.pi/2.0-v.phi
+        if abs(heading-a.getDesiredHeading())<0.01 or abs(abs(heading-a.getDesiredHeading())-2.0*math.pi)<0.01:
+            score+=500 # Airplane on heading
+            if verbose:
+                print("on heading", end=' ')
+
+        if abs(p.z-a.getDesiredAltitude())<100.0:
+            score+=250 # Airplane at altitude
+            if verbose:
+                print("at altitude", end=' ')
+        
+        if abs(abs(v)-a.getDesiredSpeed())<1.0:
+            score+=250 # Airplane at speed
+            if verbose:
+                print("at speed", end=' ')
+
+        if verbose:
+            print()
+
+    if verbose:
+        print("Your score:",score-penalties)
+    return score-penalties
+
+def runSimulation(airplane_list,controller,ticks=6000,deltat=0.1,monitor=None,engine=None,step=1):
+    """Run the simulation without a window, following the same schedule as
+    the GuiClass of fastsim.py and simulator.py. The controller is called
+    every 100 ticks and near-collisions are penalized from tick 1000 on. If
+    monitor is given it is called after every step as monitor(count,
+    airplane_list,crash_list,warning_list,penalties), and the run stops
+    early if it returns True. The physics and proximity check come from
+    engine, any object with executeTimestep and check_proximity functions,
+    which defaults to this module. Each step advances step ticks of deltat
+    seconds at once, so step must divide 100. Returns the remaining
+    airplanes, the penalties, and the number of ticks run."""
+    if engine is None:
+        engine = sys.modules[__name__]
+    if 100%step!=0:
+        raise ValueError("The step must divide the 100 ticks between controller calls, not %d"%step)
+    airplane_list = list(airplane_list)
+    penalties = 0
+    count_warnings = False
+    controller.executeControl(list(airplane_list))
+
+    count = 0
+    while count<ticks:
+        count+=step
+        engine.executeTimestep(airplane_list,deltat*step)
+        crash_list, warning_list = engine.check_proximity(airplane_list)
+
+        for p in crash_list:
+            airplane_list.remove(p)
+            penalties+=1000
+
+        if count==1000:
+            count_warnings = True
+
+        if count%100==0:
+            controller.executeControl(list(airplane_list))
+            if count_warnings:
+                penalties+=100*len(warning_list)
+
+        if monitor is not None and monitor(count,airplane_list,crash_list,warning_list,penalties):
+            break
+
+    return airplane_list, penalties, count
+
+def initWorker():
+    """Do the imports a simulation run needs, so they are paid once when a
+    worker process starts rather than on every run."""
+    numpyRandom()
+    import flight_control
+
+def runScenario(seed_value,factory=None,ticks=6000):
+    """Run the standard scenario for seed_value with a controller from
+    factory (default flight_control.FlightController) and return the score,
+    the penalties, and the number of ticks run."""
+    import flight_control
+    if factory is None:
+        factory = flight_control.FlightController
+    seed(seed_value)
+    airplane_list = createAirplaneList()
+    airplane_list, penalties, count = runSimulation(airplane_list,factory(),ticks)
+    return scoreGame(airplane_list,penalties,verbose=False), penalties, count
+
+def _runScenario(args):
+    return runScenario(*args)
+
+class WorkerPool(object):
+    """A pool of pre-forked worker processes. Each worker runs initWorker()
+    once when it starts and then serves runs until the pool is closed."""
+    def __init__(self,processes=None):
+        import multiprocessing
+        self.pool = multiprocessing.Pool(processes,initializer=initWorker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def map(self,function,tasks):
+        """Apply function to each task in a worker, returning the results
+        in order."""
+        return self.pool.map(function,tasks)
+
+    def imap_unordered(self,function,tasks):
+        return self.pool.imap_unordered(function,tasks)
+
+    def runScenarios(self,seeds,factory=None,ticks=6000):
+        """Run the standard scenario for each seed and return the results of
+        runScenario in the same order."""
+        return self.pool.map(_runScenario,[(s,factory,ticks) for s in seeds])
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+def startWorkers(processes=None):
+    """Start and return a WorkerPool."""
+    return WorkerPool(processes)
+
+def measureImportTime(module="simcore"):
+    """Return the seconds taken to import module in a fresh interpreter."""
+    import subprocess
+    code = ("import time; t=time.perf_counter(); import %s; "
+            "print(time.perf_counter()-t)")%module
+    output = subprocess.check_output([sys.executable,"-c",code])
+    return float(output)
+
+def main():
+    elapsed = measureImportTime()
+    print("simcore imported in %.1f ms (budget %.1f ms)"%(elapsed*1000.0,IMPORT_TIME_BUDGET*1000.0))
+    if elapsed>IMPORT_TIME_BUDGET:
+        sys.exit(1)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,39 @@
+import airplane
+import fleet
+import simcore
+import math
+import numpy
+
+def test_timestep_matches_airplane():
+    reference = fleet.Fleet.random(20,radius=50000.0,seed=1)
+    rng = numpy.random.default_rng(2)
+    reference.command_heading[:] = rng.random(20)*2.0*math.pi
+    reference.command_altitude[:] = rng.uniform(5000.0,11000.0,20)
+    reference.command_speed[:] = rng.uniform(200.0,260.0,20)
+    airplane_list = reference.toAirplanes()
+    for t in range(3000):
+        reference.executeTimestep(0.1)
+        simcore.executeTimestep(airplane_list,0.1)
+    for i, a in enumerate(airplane_list):
+        p = a.getPosition()
+        v = a.getVelocity()
+        assert abs(p.x-reference.x[i])<1e-6 and abs(p.y-reference.y[i])<1e-6 and abs(p.z-reference.z[i])<1e-6
+        assert abs(v.x-reference.vx[i])<1e-9 and abs(v.y-reference.vy[i])<1e-9 and abs(v.z-reference.vz[i])<1e-9
+
+def test_proximity_matches_simcore():
+    dense = fleet.Fleet.random(600,radius=150000.0,seed=3)
+    # Put some aircraft within the crash distance of another.
+    dense.x[1:40:2] = dense.x[0:39:2]+50.0
+    dense.y[1:40:2] = dense.y[0:39:2]
+    dense.z[1:40:2] = dense.z[0:39:2]
+    airplane_list = dense.toAirplanes()
+    crash_index, warning_index = dense.check_proximity()
+    crash_list, warning_list = simcore.check_proximity(airplane_list)
+    assert len(crash_index)>0 and 0<len(warning_index)<len(dense)
+    assert sorted(dense.getName(i) for i in crash_index)==sorted(a.getName() for a in crash_list)
+    assert sorted(dense.getName(i) for i in warning_index)==sorted(a.getName() for a in warning_list)
+
+def test_float32_precision_within_radius():
+    result = fleet.checkPrecision(fleet.Fleet.random(2000,radius=50000.0,seed=4),control=fleet.holdingPattern)
+    assert result['within_float32_radius']
+    assert result['position_error']<10.0
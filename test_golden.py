@@ -0,0 +1,37 @@
+import golden
+import simcore
+import glob
+import os
+import types
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),"golden")
+
+def loadGoldens():
+    paths = sorted(glob.glob(os.path.join(GOLDEN_DIR,"seed*.golden")))
+    assert len(paths)>0
+    return [golden.Golden.load(path) for path in paths]
+
+def test_golden_files_match_simcore():
+    for g in loadGoldens():
+        report = golden.compare(g,simcore)
+        assert report.ok, str(report)
+
+def test_state_divergence_reports_tick_range():
+    def drift(airplane_list,deltat):
+        simcore.executeTimestep(airplane_list,deltat)
+        for a in airplane_list:
+            a.position.x+=1e-5
+    engine = types.SimpleNamespace(executeTimestep=drift,check_proximity=simcore.check_proximity)
+    g = loadGoldens()[0]
+    divergence = golden.compare(g,engine).divergence
+    assert divergence.field=='x'
+    assert divergence.tick%g.stride==0
+    assert divergence.since==divergence.tick-g.stride+1
+
+def test_coarse_engine_compared_on_shared_ticks():
+    engine = types.SimpleNamespace(executeTimestep=simcore.executeTimestep,
+                                   check_proximity=simcore.check_proximity,STEP=4)
+    g = loadGoldens()[0]
+    divergence = golden.compare(g,engine).divergence
+    assert divergence.field in golden.FIELDS
+    assert divergence.tick%20==0
@@ -0,0 +1,84 @@
+import airplane
+import resolution
+import simcore
+import vector
+import math
+
+def flyEncounter(own,intruder,duration=300.0,deltat=0.1):
+    """Fly own and intruder for duration seconds and return the seconds
+    spent in the warning zone."""
+    conflict = 0.0
+    for i in range(int(duration/deltat)):
+        own.executeTimestep(deltat)
+        intruder.executeTimestep(deltat)
+        d = intruder.getPosition()-own.getPosition()
+        if abs(d.z)<resolution.WARNING_ALTITUDE and d.x**2+d.y**2<resolution.WARNING_DISTANCE**2:
+            conflict+=deltat
+    return conflict
+
+def test_manoeuvre_applied_in_search_frame():
+    # own is below its desired altitude, so a manoeuvre offset from the
+    # desired altitude would send it back into the intruder's level.
+    north = vector.sphvec(230.0,math.pi/2.0,math.pi/2.0)
+    south = vector.sphvec(230.0,math.pi/2.0,-math.pi/2.0)
+    own = airplane.ControllableAirplane("own",vector.recvec(0.0,-20000.0,7400.0),north)
+    intruder = airplane.ControllableAirplane("intruder",vector.recvec(0.0,20000.0,7400.0),south)
+    assert own.getDesiredAltitude()!=own.getPosition().z
+
+    resolver = resolution.Resolver()
+    key = resolution.quantize(resolution.encounterGeometry(own,intruder))
+    manoeuvre = resolver.resolve(own,intruder)
+    predicted = resolver.conflictTime(key,manoeuvre)
+    manoeuvre.apply(own)
+
+    assert abs(own.commandAltitude-(7400.0+manoeuvre.delta_altitude))<1e-9
+    assert flyEncounter(own,intruder)<=predicted+resolver.timestep
+
+def test_pair_resolves_without_compounding():
+    # Both airplanes run resolveConflicts. Only one should manoeuvre, and
+    # its commands should stay the same from call to call.
+    north = vector.sphvec(230.0,math.pi/2.0,math.pi/2.0)
+    south = vector.sphvec(230.0,math.pi/2.0,-math.pi/2.0)
+    a = airplane.ControllableAirplane("a",vector.recvec(0.0,-40000.0,8000.0),north)
+    b = airplane.ControllableAirplane("b",vector.recvec(300.0,40000.0,8000.0),south)
+    airplane_list = [a,b]
+    resolver = resolution.Resolver()
+    commands = set()
+    warnings = 0
+    for tick in range(1,4001):
+        simcore.executeTimestep(airplane_list,0.1)
+        crash_list, warning_list = simcore.check_proximity(airplane_list)
+        assert len(crash_list)==0
+        warnings+=len(warning_list)
+        if tick%100==0:
+            resolution.resolveConflicts(airplane_list,resolver)
+            if tick<1500:
+                commands.add(tuple((p.commandHeading,p.commandAltitude,p.commandSpeed) for p in airplane_list))
+    assert warnings==0
+    assert len(commands)==1
+    (a_command, b_command), = commands
+    assert b_command==(b.getDesiredHeading(),b.getDesiredAltitude(),b.getDesiredSpeed())
+    assert a_command!=(a.getDesiredHeading(),a.getDesiredAltitude(),a.getDesiredSpeed())
+
+def test_search_headroom_within_limits():
+    north = vector.sphvec(230.0,math.pi/2.0,math.pi/2.0)
+    south = vector.sphvec(230.0,math.pi/2.0,-math.pi/2.0)
+    own = airplane.ControllableAirplane("own",vector.recvec(0.0,-20000.0,9700.0),north)
+    intruder = airplane.ControllableAirplane("intruder",vector.recvec(0.0,20000.0,9700.0),south)
+    key = resolution.quantize(resolution.encounterGeometry(own,intruder))
+    canonical, canonical_intruder = resolution.canonicalEncounter(key)
+    assert resolution.headroom(canonical.getPosition().z)[0]<=resolution.headroom(9700.0)[0]
+
+    resolution.Resolver().resolve(own,intruder).apply(own)
+    assert airplane.ControllableAirplane.alt_min<=own.commandAltitude<=airplane.ControllableAirplane.alt_max
+
+def test_cache_hit_and_eviction():
+    cache = resolution.ResolutionCache(maxsize=2)
+    cache.put((0,0,0,0),resolution.Manoeuvre())
+    cache.put((1,0,0,0),resolution.Manoeuvre(0.1))
+    assert cache.get((0,0,0,0)) is not None
+    cache.put((2,0,0,0),resolution.Manoeuvre(0.2))
+    assert (1,0,0,0) not in cache
+    assert cache.get((1,0,0,0)) is None
+    stats = cache.stats()
+    assert stats['hits']==1 and stats['misses']==1 and stats['evictions']==1
@@ -0,0 +1,12 @@
+import shardsim
+import flight_control
+
+def test_split_run_matches_single():
+    sim = shardsim.ShardedSimulation(shardsim.createScenario(0),flight_control.FlightController(),2)
+    try:
+        first = sim.run(3000)
+        assert first[1]>0
+        result = sim.run(6000)
+    finally:
+        sim.close()
+    assert shardsim.sameResult(shardsim.runSingle(shardsim.createScenario(0)),result)
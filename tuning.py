@@ -0,0 +1,176 @@
+"""Parameter search harness for flight controllers. Candidate parameter sets
+are run across several scenario seeds in parallel, and seeds are handed out
+successive-halving style: every candidate starts on a few seeds, only the
+better half carries on to twice as many, and so on.
+
+While a run is going an upper bound on its final score is tracked. Every
+airplane still flying can earn at most 2000 points at the end, and
+penalties never go away. Each round keeps the best k of its candidates, so
+once the bound falls below the k-th best completed score among the round's
+candidates on the same seed, at least k of them beat it there and the run
+is stopped early. A stopped run only shows the candidate lost on that seed,
+not by how much, so it ranks below every completed run."""
+import simcore
+import flight_control
+import multiprocessing
+import math
+
+MAX_AIRPLANE_SCORE = 2000 # 1000 for flying, 500 heading, 250 altitude, 250 speed
+CHECK_INTERVAL = 100 # ticks between checks against the cutoff
+
+def scoreBound(airplane_list,penalties):
+    """Return the highest score a run could still reach."""
+    return MAX_AIRPLANE_SCORE*len(airplane_list)-penalties
+
+def makeController(params):
+    """Create a flight_control.FlightController and set each entry of params
+    as an attribute on it."""
+    controller = flight_control.FlightController()
+    for name, value in params.items():
+        setattr(controller,name,value)
+    return controller
+
+class Trial(object):
+    """The results of one candidate parameter set. scores maps seeds to the
+    score of completed runs, and stopped maps seeds to the score bound at
+    which a run was stopped."""
+    def __init__(self,params):
+        self.params = params
+        self.scores = {}
+        self.stopped = {}
+
+    def __repr__(self):
+        return "Trial(%r, mean=%g, seeds=%d, stopped=%d)"%(self.params,self.mean(),self.seedCount(),len(self.stopped))
+
+    def seedCount(self):
+        return len(self.scores)+len(self.stopped)
+
+    def hasRun(self,seed):
+        return seed in self.scores or seed in self.stopped
+
+    def mean(self):
+        """The mean score of the completed runs."""
+        if len(self.scores)==0:
+            return -math.inf
+        return sum(self.scores.values())/len(self.scores)
+
+    def rank(self):
+        """Sort key for trials run on the same seeds, larger is better. A
+        trial with fewer stopped runs always ranks higher, so a stopped run
+        counts below any completed one."""
+        return (-len(self.stopped),self.mean())
+
+def runTrial(index,params,seed,cutoffs,ticks,factory):
+    """Run one candidate on one seed. cutoffs maps seeds to the score a run
+    must still be able to reach to stay in the round, and is checked as the
+    run goes. Returns the index, the seed, the score (or bound), whether the
+    run was stopped, and the ticks run."""
+    simcore.seed(seed)
+    airplane_list = simcore.createAirplaneList()
+    controller = factory(params)
+    stopped = []
+
+    def monitor(count,airplane_list,crash_list,warning_list,penalties):
+        if len(crash_list)==0 and count%CHECK_INTERVAL!=0:
+            return False
+        target = cutoffs.get(seed)
+        if target is not None and scoreBound(airplane_list,penalties)<target:
+            stopped.append(True)
+            return True
+        return False
+
+    airplane_list, penalties, count = simcore.runSimulation(airplane_list,controller,ticks,monitor=monitor)
+    if stopped:
+        score = scoreBound(airplane_list,penalties)
+    else:
+        score = simcore.scoreGame(airplane_list,penalties,verbose=False)
+    return index, seed, score, bool(stopped), count
+
+def _runTrial(args):
+    return runTrial(*args)
+
+def promoted(n,eta):
+    """Return how many of n candidates carry on to the next round."""
+    return int(math.ceil(n/eta))
+
+class Tuner(object):
+    """Successive-halving search over candidate parameter sets. Each round
+    the surviving candidates are run on enough seeds to bring them up to the
+    round's seed count, then the best 1/eta of them (see Trial.rank and
+    promoted) carry on and the seed count is multiplied by eta. If processes
+    is more than one the runs are spread over a simcore.WorkerPool."""
+    def __init__(self,candidates,seeds,factory=makeController,eta=2,min_seeds=1,ticks=6000,processes=None):
+        self.trials = [Trial(params) for params in candidates]
+        self.seeds = list(seeds)
+        self.factory = factory
+        self.eta = eta
+        self.min_seeds = min_seeds
+        self.ticks = ticks
+        self.processes = processes
+        self.runs = 0
+        self.stopped_runs = 0
+        self.ticks_run = 0
+
+    def run(self):
+        """Run the search and return the trials, best first. Trials which
+        survived to later rounds rank ahead of those dropped earlier."""
+        if self.processes==1:
+            cutoffs = {}
+            self.search(cutoffs,map)
+        else:
+            with multiprocessing.Manager() as manager:
+                cutoffs = manager.dict()
+                with simcore.startWorkers(self.processes) as pool:
+                    self.search(cutoffs,lambda f, tasks: pool.imap_unordered(f,tasks))
+        return sorted(self.trials,key=lambda t: (t.seedCount(),t.rank()),reverse=True)
+
+    def cutoff(self,active,seed):
+        """Return the promoted()-th best completed score on seed among the
+        active trials, or None if not enough have completed."""
+        scores = sorted((self.trials[i].scores[seed] for i in active if seed in self.trials[i].scores),reverse=True)
+        k = promoted(len(active),self.eta)
+        if len(scores)<k:
+            return None
+        return scores[k-1]
+
+    def search(self,cutoffs,mapper):
+        active = list(range(len(self.trials)))
+        nseeds = min(self.min_seeds,len(self.seeds))
+        while True:
+            cutoffs.clear()
+            tasks = []
+            for seed in self.seeds[:nseeds]:
+                target = self.cutoff(active,seed)
+                if target is not None:
+                    cutoffs[seed] = target
+                for i in active:
+                    if not self.trials[i].hasRun(seed):
+                        tasks.append((i,self.trials[i].params,seed,cutoffs,self.ticks,self.factory))
+
+            for i, seed, score, stopped, count in mapper(_runTrial,tasks):
+                trial = self.trials[i]
+                self.runs+=1
+                self.ticks_run+=count
+                if stopped:
+                    trial.stopped[seed] = score
+                    self.stopped_runs+=1
+                else:
+                    trial.scores[seed] = score
+                    target = self.cutoff(active,seed)
+                    if target is not None:
+                        cutoffs[seed] = target
+
+            if len(active)<=1 or nseeds>=len(self.seeds):
+                break
+            active.sort(key=lambda i: self.trials[i].rank(),reverse=True)
+            active = active[:promoted(len(active),self.eta)]
+            nseeds = min(nseeds*self.eta,len(self.seeds))
+
+    def stats(self):
+        """Return a dictionary describing the work done."""
+        return {'runs':self.runs,'stopped':self.stopped_runs,
+                'ticks':self.ticks_run,'full_ticks':self.runs*self.ticks}
+
+def tune(candidates,seeds,**kwargs):
+    """Run a Tuner over candidates and seeds and return the best trial."""
+    return Tuner(candidates,seeds,**kwargs).run()[0]